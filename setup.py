@@ -52,6 +52,9 @@ typecheck_requires = [
 dev_requires: List[str] = [
     # 'pytest-sugar>=0.9.1',
 ]
+uvloop_requires = [
+    'uvloop>=0.15.3',
+]
 docs_requires = [
     'Sphinx~=3.4.3',
     'sphinx-intl>=2.0',
@@ -112,6 +115,7 @@ setup(
         'lint': lint_requires,
         'typecheck': typecheck_requires,
         'docs': docs_requires,
+        'uvloop': uvloop_requires,
     },
     data_files=[],
     package_data={
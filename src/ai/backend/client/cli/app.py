@@ -5,20 +5,50 @@ import sys
 from typing import (
     Union, Optional,
     MutableMapping, Dict,
-    Sequence, List,
+    Sequence, List, Set,
 )
 
 import aiohttp
 import click
+import humanize
 
 from . import main
 from .pretty import print_info, print_warn, print_fail, print_error
-from ..config import DEFAULT_CHUNK_SIZE
-from ..request import Request
+from .utils import (
+    ByteSizeParamType,
+    install_uvloop,
+    WS_BINARY, WS_CLOSE, WS_ERROR,
+)
+from ..config import (
+    DEFAULT_PROXY_BUFFER_SIZE,
+    MIN_PROXY_BUFFER_SIZE,
+    PROXY_DRAIN_HIGH_WATER,
+)
+from ..request import Request, WebSocketResponse
 from ..session import AsyncSession
-from ..compat import asyncio_run, asyncio_run_forever
+from ..compat import asyncio_run, asyncio_run_forever, current_loop
 from ..versioning import get_naming
 
+_error_response_prefix = (
+    b'HTTP/1.1 503 Service Unavailable\r\n'
+    b'Connection: Closed\r\n\r\n'
+    b'WebSocket reply: '
+)
+
+
+def _is_binary_queued(raw_ws: aiohttp.ClientWebSocketResponse) -> bool:
+    """
+    Check if the next message already received by the WebSocket is a binary message.
+    """
+    # This peeks the private (message, size) tuple queue of aiohttp's
+    # FlowControlDataQueue, which is stable in aiohttp ~=3.7 as required by setup.py.
+    # If a future aiohttp version changes the layout, just stop merging.
+    try:
+        queued = raw_ws._reader._buffer  # type: ignore
+        return bool(queued) and queued[0][0].type == WS_BINARY
+    except (AttributeError, IndexError, TypeError):
+        return False
+
 
 class WSProxy:
     __slots__ = (
@@ -26,8 +56,11 @@ class WSProxy:
         'app_name',
         'args', 'envs',
         'reader', 'writer',
+        'buffer_size', 'coalesce_delay',
     )
 
+    BUFFER_SIZE = DEFAULT_PROXY_BUFFER_SIZE
+
     def __init__(
         self,
         api_session: AsyncSession,
@@ -37,6 +70,9 @@ class WSProxy:
         envs: MutableMapping[str, str],
         reader: asyncio.StreamReader,
         writer: asyncio.StreamWriter,
+        *,
+        buffer_size: Optional[int] = None,
+        coalesce_delay: float = 0,
     ) -> None:
         self.api_session = api_session
         self.session_name = session_name
@@ -45,6 +81,8 @@ class WSProxy:
         self.envs = envs
         self.reader = reader
         self.writer = writer
+        self.buffer_size = buffer_size if buffer_size is not None else self.BUFFER_SIZE
+        self.coalesce_delay = coalesce_delay
 
     async def run(self) -> None:
         prefix = get_naming(self.api_session.api_version, 'path')
@@ -61,36 +99,13 @@ class WSProxy:
             params=params,
             content_type="application/json")
         async with api_rqst.connect_websocket() as ws:
-
-            async def downstream() -> None:
-                try:
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.ERROR:
-                            await self.write_error(msg)
-                            break
-                        elif msg.type == aiohttp.WSMsgType.CLOSE:
-                            if msg.data != aiohttp.WSCloseCode.OK:
-                                await self.write_error(msg)
-                            break
-                        elif msg.type == aiohttp.WSMsgType.BINARY:
-                            self.writer.write(msg.data)
-                            await self.writer.drain()
-                except ConnectionResetError:
-                    pass  # shutting down
-                except asyncio.CancelledError:
-                    pass
-                finally:
-                    self.writer.close()
-                    try:
-                        await self.writer.wait_closed()
-                    except (BrokenPipeError, IOError):
-                        # closed
-                        pass
-
-            down_task = asyncio.create_task(downstream())
+            down_task = asyncio.create_task(self.relay_downstream(ws))
             try:
+                # NOTE: asyncio.StreamReader has no readinto() API, and the client-side
+                # WebSocket writer copies the payload into a fresh bytearray to apply
+                # the mask anyway, so a reusable receive buffer would not save a copy.
                 while True:
-                    chunk = await self.reader.read(DEFAULT_CHUNK_SIZE)
+                    chunk = await self.read_coalesced()
                     if not chunk:
                         break
                     await ws.send_bytes(chunk)
@@ -103,15 +118,96 @@ class WSProxy:
                     down_task.cancel()
                     await down_task
 
+    async def relay_downstream(self, ws: WebSocketResponse) -> None:
+        raw_ws = ws.raw_websocket
+        merged_chunks: List[bytes] = []
+        merged_bytes = 0
+        pending_bytes = 0
+
+        async def flush() -> None:
+            nonlocal merged_bytes, pending_bytes
+            if not merged_chunks:
+                return
+            self.writer.write(b''.join(merged_chunks))
+            merged_chunks.clear()
+            pending_bytes += merged_bytes
+            merged_bytes = 0
+            if pending_bytes >= PROXY_DRAIN_HIGH_WATER:
+                await self.writer.drain()
+                pending_bytes = 0
+
+        try:
+            async for msg in ws:
+                # Check the data messages first as they are the majority.
+                if msg.type == WS_BINARY:
+                    merged_chunks.append(msg.data)
+                    merged_bytes += len(msg.data)
+                    # Merge the data messages already received and queued
+                    # into a single write to the local client.
+                    # Stop at other queued messages (e.g., PONG) since receive()
+                    # consumes them internally and then may wait for long.
+                    if merged_bytes < self.buffer_size and _is_binary_queued(raw_ws):
+                        continue
+                    await flush()
+                elif msg.type == WS_ERROR:
+                    await flush()
+                    await self.write_error(msg)
+                    break
+                elif msg.type == WS_CLOSE:
+                    await flush()
+                    if msg.data != aiohttp.WSCloseCode.OK:
+                        await self.write_error(msg)
+                    break
+            else:
+                await flush()
+        except ConnectionResetError:
+            pass  # shutting down
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (BrokenPipeError, IOError):
+                # closed
+                pass
+
+    async def read_coalesced(self) -> bytes:
+        """
+        Read a chunk from the local client and, if a coalescing delay is set,
+        keep accumulating the subsequent chunks until the buffer becomes full
+        or the delay elapses so that small writes are sent as a single frame.
+        """
+        chunk = await self.reader.read(self.buffer_size)
+        if not chunk or self.coalesce_delay <= 0 or len(chunk) >= self.buffer_size:
+            return chunk
+        loop = current_loop()
+        deadline = loop.time() + self.coalesce_delay
+        buf = bytearray(chunk)
+        while len(buf) < self.buffer_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                # Cancelling a pending read() keeps the buffered data intact.
+                more = await asyncio.wait_for(
+                    self.reader.read(self.buffer_size - len(buf)),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                break
+            if not more:
+                break  # EOF is reported by the next read.
+            buf += more
+        return bytes(buf)
+
     async def write_error(self, msg: aiohttp.WSMessage) -> None:
         if isinstance(msg.data, bytes):
-            error_msg = msg.data.decode('utf8')
+            error_msg = msg.data
         else:
-            error_msg = str(msg.data)
-        rsp = 'HTTP/1.1 503 Service Unavailable\r\n' \
-              'Connection: Closed\r\n\r\n' \
-              'WebSocket reply: {}'.format(error_msg)
-        self.writer.write(rsp.encode())
+            error_msg = str(msg.data).encode('utf8')
+        self.writer.write(_error_response_prefix)
+        self.writer.write(error_msg)
         await self.writer.drain()
 
 
@@ -122,6 +218,8 @@ class ProxyRunnerContext:
         'protocol', 'host', 'port',
         'args', 'envs',
         'api_session', 'local_server',
+        'buffer_size', 'coalesce_delay',
+        'connection_tasks',
         'exit_code',
     )
 
@@ -134,6 +232,9 @@ class ProxyRunnerContext:
     envs: Dict[str, str]
     api_session: Optional[AsyncSession]
     local_server: Optional[asyncio.AbstractServer]
+    buffer_size: int
+    coalesce_delay: float
+    connection_tasks: Set[asyncio.Task]
     exit_code: int
 
     def __init__(
@@ -146,15 +247,20 @@ class ProxyRunnerContext:
         protocol: str = 'tcp',
         args: Sequence[str] = None,
         envs: Sequence[str] = None,
+        buffer_size: int = DEFAULT_PROXY_BUFFER_SIZE,
+        coalesce_delay: float = 0,
     ) -> None:
         self.host = host
         self.port = port
         self.session_name = session_name
         self.app_name = app_name
         self.protocol = protocol
+        self.buffer_size = buffer_size
+        self.coalesce_delay = coalesce_delay
 
         self.api_session = None
         self.local_server = None
+        self.connection_tasks = set()
         self.exit_code = 0
 
         self.args, self.envs = {}, {}
@@ -184,12 +290,35 @@ class ProxyRunnerContext:
                 else:
                     self.envs[split[0]] = ''
 
+    def accept_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        # Register the connection task as soon as it is accepted,
+        # so that __aexit__() can terminate it even before it starts running.
+        task = asyncio.create_task(self.handle_connection(reader, writer))
+        self.connection_tasks.add(task)
+
+        def _finalize(task: asyncio.Task) -> None:
+            self.connection_tasks.discard(task)
+            # The task may have been cancelled before closing the writer by itself.
+            writer.close()
+
+        task.add_done_callback(_finalize)
+
     async def handle_connection(
         self,
         reader: asyncio.StreamReader,
         writer: asyncio.StreamWriter,
     ) -> None:
         assert self.api_session is not None
+        # Match the transport's write-buffer limits with the drain interval of WSProxy
+        # so that the backpressure propagates to the remote WebSocket peer.
+        writer.transport.set_write_buffer_limits(
+            high=PROXY_DRAIN_HIGH_WATER,
+            low=PROXY_DRAIN_HIGH_WATER // 4,
+        )
         p = WSProxy(
             self.api_session,
             self.session_name,
@@ -198,6 +327,8 @@ class ProxyRunnerContext:
             self.envs,
             reader,
             writer,
+            buffer_size=self.buffer_size,
+            coalesce_delay=self.coalesce_delay,
         )
         try:
             await p.run()
@@ -208,7 +339,7 @@ class ProxyRunnerContext:
 
     async def __aenter__(self) -> None:
         self.exit_code = 0
-        self.api_session = AsyncSession()
+        self.api_session = AsyncSession(connector_limit=0)
         await self.api_session.__aenter__()
 
         user_url_template = "{protocol}://{host}:{port}"
@@ -225,8 +356,12 @@ class ProxyRunnerContext:
                 self.exit_code = 1
                 return
 
+            # StreamReader pauses the socket when it holds more than twice the limit.
+            # Keep room for several copy buffers so that a read() after a slow
+            # WebSocket send returns a full buffer and the socket is paused less often.
             self.local_server = await asyncio.start_server(
-                self.handle_connection, self.host, self.port)
+                self.accept_connection, self.host, self.port,
+                limit=self.buffer_size * 4)
             user_url = user_url_template.format(
                 protocol=self.protocol,
                 host=self.host,
@@ -248,6 +383,12 @@ class ProxyRunnerContext:
         if self.local_server is not None:
             print_info("Shutting down....")
             self.local_server.close()
+            # Terminate the in-flight connections before closing the API session
+            # used by them.
+            pending_tasks = [*self.connection_tasks]
+            for task in pending_tasks:
+                task.cancel()
+            await asyncio.gather(*pending_tasks, return_exceptions=True)
             await self.local_server.wait_closed()
         assert self.api_session is not None
         await self.api_session.__aexit__(*exc_info)
@@ -267,7 +408,17 @@ class ProxyRunnerContext:
               help='Add additional argument when starting service.')
 @click.option('-e', '--env', type=str, multiple=True, metavar='"ENVNAME=envvalue"',
               help='Add additional environment variable when starting service.')
-def app(session_name, app, bind, arg, env):
+@click.option('--buffer-size', type=ByteSizeParamType(min_value=MIN_PROXY_BUFFER_SIZE),
+              default=DEFAULT_PROXY_BUFFER_SIZE,
+              show_default=True,
+              help='The size of the copy buffer used to relay the app traffic '
+                   'with binary suffixes (e.g., "256k").  It must be at least '
+                   f'{humanize.naturalsize(MIN_PROXY_BUFFER_SIZE, binary=True)}.')
+@click.option('--coalesce-ms', type=click.FloatRange(min=0), default=0, show_default=True,
+              help='Wait up to the given milliseconds to merge small writes from '
+                   'the local client into a single WebSocket frame. '
+                   'Set 0 to send each read immediately.')
+def app(session_name, app, bind, arg, env, buffer_size, coalesce_ms):
     """
     Run a local proxy to a service provided by Backend.AI compute sessions.
 
@@ -284,6 +435,7 @@ def app(session_name, app, bind, arg, env):
     elif len(bind_parts) == 2:
         host = bind_parts[0]
         port = int(bind_parts[1])
+    install_uvloop()
     try:
         proxy_ctx = ProxyRunnerContext(
             host, port,
@@ -291,6 +443,8 @@ def app(session_name, app, bind, arg, env):
             protocol='tcp',
             args=arg,
             envs=env,
+            buffer_size=buffer_size,
+            coalesce_delay=coalesce_ms / 1000,
         )
         asyncio_run_forever(proxy_ctx)
         sys.exit(proxy_ctx.exit_code)
@@ -2,38 +2,49 @@ from __future__ import annotations
 
 import asyncio
 import json
+import logging
 import re
 from typing import (
     Union,
-    Tuple,
     AsyncIterator,
+    cast,
 )
 
 import aiohttp
 from aiohttp import web
 import click
+import humanize
 
 from . import main
-from .pretty import print_info, print_error, print_fail
+from .utils import (
+    ByteSizeParamType,
+    install_uvloop,
+    WS_TEXT, WS_BINARY, WS_CLOSE, WS_CLOSED, WS_ERROR, WS_DATA_TYPES,
+)
+from .pretty import print_error, print_fail
+from ..config import (
+    DEFAULT_PROXY_BUFFER_SIZE,
+    MIN_PROXY_BUFFER_SIZE,
+    PROXY_DRAIN_HIGH_WATER,
+)
 from ..exceptions import BackendAPIError, BackendClientError
 from ..request import Request
 from ..session import AsyncSession
 
+log = logging.getLogger('ai.backend.client.cli.proxy')
+
+_rx_version_prefix = re.compile(r'^/?v(\d+)/')
+
 
 class WebSocketProxy:
     __slots__ = (
         'up_conn', 'down_conn',
-        'upstream_buffer', 'upstream_buffer_task',
     )
 
-    upstream_buffer: asyncio.Queue[Tuple[Union[str, bytes], aiohttp.WSMsgType]]
-
     def __init__(self, up_conn: aiohttp.ClientWebSocketResponse,
                  down_conn: web.WebSocketResponse):
         self.up_conn = up_conn
         self.down_conn = down_conn
-        self.upstream_buffer = asyncio.Queue()
-        self.upstream_buffer_task = None
 
     async def proxy(self):
         asyncio.ensure_future(self.downstream())
@@ -42,13 +53,13 @@ class WebSocketProxy:
     async def upstream(self):
         try:
             async for msg in self.down_conn:
-                if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                if msg.type in WS_DATA_TYPES:
                     await self.send(msg.data, msg.type)
-                elif msg.type == aiohttp.WSMsgType.ERROR:
+                elif msg.type == WS_ERROR:
                     print_fail("ws connection closed with exception {}"
                                .format(self.up_conn.exception()))
                     break
-                elif msg.type == aiohttp.WSMsgType.CLOSE:
+                elif msg.type == WS_CLOSE:
                     break
             # here, client gracefully disconnected
         except asyncio.CancelledError:
@@ -59,17 +70,15 @@ class WebSocketProxy:
 
     async def downstream(self):
         try:
-            self.upstream_buffer_task = \
-                    asyncio.ensure_future(self.consume_upstream_buffer())
-            print_info("websocket proxy started")
+            log.debug("websocket proxy started")
             async for msg in self.up_conn:
-                if msg.type == aiohttp.WSMsgType.TEXT:
+                if msg.type == WS_TEXT:
                     await self.down_conn.send_str(msg.data)
-                elif msg.type == aiohttp.WSMsgType.BINARY:
+                elif msg.type == WS_BINARY:
                     await self.down_conn.send_bytes(msg.data)
-                elif msg.type == aiohttp.WSMsgType.CLOSED:
+                elif msg.type == WS_CLOSED:
                     break
-                elif msg.type == aiohttp.WSMsgType.ERROR:
+                elif msg.type == WS_ERROR:
                     break
             # here, server gracefully disconnected
         except asyncio.CancelledError:
@@ -78,31 +87,23 @@ class WebSocketProxy:
             print_fail('unexpected error: {}'.format(e))
         finally:
             await self.close_upstream()
-            print_info("websocket proxy terminated")
-
-    async def consume_upstream_buffer(self):
-        try:
-            while True:
-                data, tp = await self.upstream_buffer.get()
-                if not self.up_conn.closed:
-                    if tp == aiohttp.WSMsgType.BINARY:
-                        await self.up_conn.send_bytes(data)
-                    elif tp == aiohttp.WSMsgType.TEXT:
-                        await self.up_conn.send_str(data)
-        except asyncio.CancelledError:
-            pass
-
-    async def send(self, msg: str, tp: aiohttp.WSMsgType):
-        await self.upstream_buffer.put((msg, tp))
+            log.debug("websocket proxy terminated")
+
+    async def send(self, msg: Union[str, bytes], tp: aiohttp.WSMsgType):
+        # Sending directly is cheaper than relaying through a queue and a separate
+        # task, as send_*() only yields to the event loop under flow control.
+        if self.up_conn.closed:
+            return
+        if tp == WS_BINARY:
+            await self.up_conn.send_bytes(cast(bytes, msg))
+        elif tp == WS_TEXT:
+            await self.up_conn.send_str(cast(str, msg))
 
     async def close_downstream(self):
         if not self.down_conn.closed:
             await self.down_conn.close()
 
     async def close_upstream(self):
-        if not self.upstream_buffer_task.done():
-            self.upstream_buffer_task.cancel()
-            await self.upstream_buffer_task
         if not self.up_conn.closed:
             await self.up_conn.close()
 
@@ -119,7 +120,7 @@ def _translate_headers(upstream_request: Request, client_request: Request) -> No
 
 
 async def web_handler(request):
-    path = re.sub(r'^/?v(\d+)/', '/', request.path)
+    path = _rx_version_prefix.sub('/', request.path, count=1)
     try:
         # We treat all requests and responses as streaming universally
         # to be a transparent proxy.
@@ -138,11 +139,18 @@ async def web_handler(request):
             down_resp.headers.update(up_resp.headers)
             down_resp.headers['Access-Control-Allow-Origin'] = '*'
             await down_resp.prepare(request)
-            while True:
-                chunk = await up_resp.read(8192)
-                if not chunk:
-                    break
-                await down_resp.write(chunk)
+            # StreamResponse.write() drains whenever more than 64 KiB is buffered,
+            # so we write to the underlying payload writer and drain in batches.
+            payload_writer = down_resp._payload_writer
+            assert payload_writer is not None
+            pending_bytes = 0
+            # Each chunk contains all the data available at the moment up to buffer_size.
+            async for chunk in up_resp.content.iter_chunked(request.app['buffer_size']):
+                await payload_writer.write(chunk, drain=False)
+                pending_bytes += len(chunk)
+                if pending_bytes >= PROXY_DRAIN_HIGH_WATER:
+                    await payload_writer.drain()
+                    pending_bytes = 0
             return down_resp
     except BackendAPIError as e:
         return web.Response(body=json.dumps(e.data),
@@ -166,7 +174,7 @@ async def web_handler(request):
 
 
 async def websocket_handler(request):
-    path = re.sub(r'^/?v(\d+)/', '/', request.path)
+    path = _rx_version_prefix.sub('/', request.path, count=1)
     try:
         api_rqst = Request(
             request.method, path, request.content,
@@ -202,13 +210,18 @@ async def websocket_handler(request):
 
 
 async def proxy_context(app: web.Application) -> AsyncIterator[None]:
-    app['client_session'] = AsyncSession()
+    # Let the upstream response reader buffer at least a full chunk to relay.
+    app['client_session'] = AsyncSession(
+        connector_limit=0,
+        read_bufsize=app['buffer_size'],
+    )
     async with app['client_session']:
         yield
 
 
-def create_proxy_app():
+def create_proxy_app(*, buffer_size: int = DEFAULT_PROXY_BUFFER_SIZE):
     app = web.Application()
+    app['buffer_size'] = buffer_size
     app.cleanup_ctx.append(proxy_context)
 
     app.router.add_route("GET", r'/stream/{path:.*$}', websocket_handler)
@@ -223,11 +236,18 @@ def create_proxy_app():
 @click.option('-p', '--port', type=int, default=8084,
               help='The TCP port to accept non-encrypted non-authorized '
                    'API requests.')
+@click.option('--buffer-size', type=ByteSizeParamType(min_value=MIN_PROXY_BUFFER_SIZE),
+              default=DEFAULT_PROXY_BUFFER_SIZE,
+              show_default=True,
+              help='The size of the copy buffer used to relay the response bodies '
+                   'with binary suffixes (e.g., "256k").  It must be at least '
+                   f'{humanize.naturalsize(MIN_PROXY_BUFFER_SIZE, binary=True)}.')
 @click.pass_context
-def proxy(ctx, bind, port):
+def proxy(ctx, bind, port, buffer_size):
     """
     Run a non-encrypted non-authorized API proxy server.
     Use this only for development and testing!
     """
-    app = create_proxy_app()
+    install_uvloop()
+    app = create_proxy_app(buffer_size=buffer_size)
     web.run_app(app, host=bind, port=port)
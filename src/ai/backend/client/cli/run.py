@@ -86,6 +86,8 @@ async def exec_loop(stdout, stderr, compute_session, mode, code, *, opts=None,
     """
     Fully streamed asynchronous version of the execute loop.
     """
+    stdout_write = stdout.write
+    stderr_write = stderr.write
     async with compute_session.stream_execute(code, mode=mode, opts=opts) as stream:
         async for result in stream:
             if result.type == aiohttp.WSMsgType.TEXT:
@@ -95,15 +97,17 @@ async def exec_loop(stdout, stderr, compute_session, mode, code, *, opts=None,
                 continue
             for rec in result.get('console', []):
                 if rec[0] == 'stdout':
-                    print(rec[1], end='', file=stdout)
+                    stdout_write(rec[1])
                 elif rec[0] == 'stderr':
-                    print(rec[1], end='', file=stderr)
+                    stderr_write(rec[1])
                 else:
-                    print('----- output record (type: {0}) -----'.format(rec[0]),
-                          file=stdout)
-                    print(rec[1], file=stdout)
-                    print('----- end of record -----', file=stdout)
+                    stdout_write(
+                        '----- output record (type: {0}) -----\n'
+                        '{1}\n'
+                        '----- end of record -----\n'.format(rec[0], rec[1])
+                    )
             stdout.flush()
+            stderr.flush()
             files = result.get('files', [])
             if files:
                 print('--- generated files ---', file=stdout)
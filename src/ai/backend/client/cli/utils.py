@@ -1,10 +1,21 @@
+import asyncio
 import json
 import re
 import textwrap
 from typing import Any, Mapping, Optional
 
+import aiohttp
 import click
 
+# Pre-bound WebSocket message types to avoid repeated attribute lookups
+# in the relay loops of the local proxies.
+WS_TEXT = aiohttp.WSMsgType.TEXT
+WS_BINARY = aiohttp.WSMsgType.BINARY
+WS_CLOSE = aiohttp.WSMsgType.CLOSE
+WS_CLOSED = aiohttp.WSMsgType.CLOSED
+WS_ERROR = aiohttp.WSMsgType.ERROR
+WS_DATA_TYPES = (WS_TEXT, WS_BINARY)
+
 
 class ByteSizeParamType(click.ParamType):
     name = "byte"
@@ -19,17 +30,23 @@ class ByteSizeParamType(click.ParamType):
         'e': 2 ** 60,
     }
 
+    def __init__(self, *, min_value: int = None) -> None:
+        self.min_value = min_value
+
     def convert(self, value, param, ctx):
         if isinstance(value, int):
-            return value
-        if not isinstance(value, str):
-            self.fail(f"expected string, got {value!r} of type {type(value).__name__}", param, ctx)
-        m = self._rx_digits.search(value)
-        if m is None:
-            self.fail(f"{value!r} is not a valid byte-size expression", param, ctx)
-        size = float(m.group(1))
-        unit = m.group(2).lower()
-        return int(size * self._scales.get(unit, 1))
+            size = value
+        else:
+            if not isinstance(value, str):
+                self.fail(f"expected string, got {value!r} of type {type(value).__name__}", param, ctx)
+            m = self._rx_digits.search(value)
+            if m is None:
+                self.fail(f"{value!r} is not a valid byte-size expression", param, ctx)
+            unit = m.group(2).lower()
+            size = int(float(m.group(1)) * self._scales.get(unit, 1))
+        if self.min_value is not None and size < self.min_value:
+            self.fail(f"{value!r} is smaller than the minimum of {self.min_value} bytes", param, ctx)
+        return size
 
 
 class ByteSizeParamCheckType(ByteSizeParamType):
@@ -46,6 +63,18 @@ class ByteSizeParamCheckType(ByteSizeParamType):
         return value
 
 
+def install_uvloop() -> None:
+    """
+    Set the uvloop's event loop policy as the default if it is installed,
+    to speed up I/O-bound loops such as the local proxies.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
 def format_stats(raw_stats: Optional[str], indent='') -> str:
     if raw_stats is None:
         return "(unavailable)"
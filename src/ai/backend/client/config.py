@@ -27,6 +27,9 @@ __all__ = [
     'API_VERSION',
     'DEFAULT_CHUNK_SIZE',
     'MAX_INFLIGHT_CHUNKS',
+    'DEFAULT_PROXY_BUFFER_SIZE',
+    'MIN_PROXY_BUFFER_SIZE',
+    'PROXY_DRAIN_HIGH_WATER',
 ]
 
 
@@ -42,6 +45,15 @@ API_VERSION = (6, '20210815')
 DEFAULT_CHUNK_SIZE = 16 * (2**20)  # 16 MiB
 MAX_INFLIGHT_CHUNKS = 4
 
+# The copy buffer size of the local app/API proxies.  A large buffer amortizes
+# the per-chunk event-loop round-trip and write overheads over more payload bytes.
+# (clash-rs measured 3.8 -> 19 Gbps by raising it from 4 KiB to 50 KiB.)
+DEFAULT_PROXY_BUFFER_SIZE = 64 * (2**10)  # 64 KiB
+MIN_PROXY_BUFFER_SIZE = 4 * (2**10)  # 4 KiB
+
+# The amount of data the local app/API proxies write to their clients between drains.
+PROXY_DRAIN_HIGH_WATER = 256 * (2**10)  # 256 KiB
+
 local_state_path = Path(appdirs.user_state_dir('backend.ai', 'Lablup'))
 local_cache_path = Path(appdirs.user_cache_dir('backend.ai', 'Lablup'))
 
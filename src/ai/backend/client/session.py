@@ -445,19 +445,30 @@ class AsyncSession(BaseSession):
     A context manager for API client sessions that makes API requests asynchronously.
     You may call all APIs as coroutines.
     WebSocket-based APIs and SSE-based APIs returns special response types.
+
+    :param connector_limit: The maximum number of simultaneous connections
+        to the API server.  Set 0 to make it unlimited, e.g., for local proxies
+        which keep a WebSocket connection open per each client connection.
+    :param read_bufsize: The size of the read buffer of response bodies.
+        Reading pauses when the buffered data exceeds twice of this size.
     """
 
     def __init__(
         self, *,
         config: APIConfig = None,
         proxy_mode: bool = False,
+        connector_limit: int = 100,
+        read_bufsize: int = 2**16,
     ) -> None:
         super().__init__(config=config, proxy_mode=proxy_mode)
         ssl = None
         if self._config.skip_sslcert_validation:
             ssl = False
-        connector = aiohttp.TCPConnector(ssl=ssl)
-        self.aiohttp_session = aiohttp.ClientSession(connector=connector)
+        connector = aiohttp.TCPConnector(ssl=ssl, limit=connector_limit)
+        self.aiohttp_session = aiohttp.ClientSession(
+            connector=connector,
+            read_bufsize=read_bufsize,
+        )
 
     async def _aopen(self) -> None:
         self._context_token = api_session.set(self)
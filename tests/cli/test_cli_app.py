@@ -0,0 +1,253 @@
+import asyncio
+import collections
+from unittest import mock
+
+import aiohttp
+from aiohttp import web
+from click.testing import CliRunner
+import pytest
+
+from ai.backend.client.cli import main
+from ai.backend.client.cli.app import ProxyRunnerContext, WSProxy, _is_binary_queued
+from ai.backend.client.request import WebSocketResponse
+
+
+def create_wsproxy(reader, *, buffer_size=4096, coalesce_delay=0.0):
+    return WSProxy(
+        mock.Mock(), 'mysession', 'myapp', {}, {},
+        reader, mock.Mock(),
+        buffer_size=buffer_size,
+        coalesce_delay=coalesce_delay,
+    )
+
+
+@pytest.mark.asyncio
+async def test_read_coalesced_without_delay():
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'abc')
+    p = create_wsproxy(reader)
+    assert await p.read_coalesced() == b'abc'
+
+
+@pytest.mark.asyncio
+async def test_read_coalesced_merges_until_deadline():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'abc')
+    loop.call_later(0.01, reader.feed_data, b'def')
+    loop.call_later(0.5, reader.feed_data, b'ghi')
+    p = create_wsproxy(reader, coalesce_delay=0.1)
+    begin = loop.time()
+    chunk = await p.read_coalesced()
+    assert chunk == b'abcdef'
+    assert type(chunk) is bytes
+    assert 0.1 <= loop.time() - begin < 0.4
+    # The data arriving after the deadline is kept for the next read.
+    assert await p.read_coalesced() == b'ghi'
+
+
+@pytest.mark.asyncio
+async def test_read_coalesced_stops_when_buffer_is_full():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'a' * 100)
+    loop.call_later(0.01, reader.feed_data, b'b' * 5000)
+    p = create_wsproxy(reader, coalesce_delay=1.0)
+    begin = loop.time()
+    chunk = await p.read_coalesced()
+    assert loop.time() - begin < 0.5
+    assert chunk == b'a' * 100 + b'b' * 3996
+    assert type(chunk) is bytes
+    assert await reader.read(4096) == b'b' * 1004
+
+
+@pytest.mark.asyncio
+async def test_read_coalesced_eof_during_coalescing():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'abc')
+    loop.call_later(0.01, reader.feed_eof)
+    p = create_wsproxy(reader, coalesce_delay=1.0)
+    begin = loop.time()
+    assert await p.read_coalesced() == b'abc'
+    assert loop.time() - begin < 0.5
+    assert await p.read_coalesced() == b''
+
+
+def test_app_rejects_negative_coalesce_delay():
+    runner = CliRunner()
+    result = runner.invoke(main, ['app', 'mysession', 'myapp', '--coalesce-ms', '-1'])
+    assert result.exit_code == 2
+    assert '--coalesce-ms' in result.output
+
+
+class DummyAPISession:
+
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    async def __aexit__(self, *exc_info):
+        self.events.append('api-session-closed')
+        self.closed = True
+
+
+@pytest.fixture
+async def proxy_ctx_fixture(monkeypatch, unused_tcp_port_factory):
+    events = []
+
+    async def mock_run(self):
+        events.append('connection-started')
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            events.append('connection-cancelled')
+            raise
+
+    monkeypatch.setattr(WSProxy, 'run', mock_run)
+    port = unused_tcp_port_factory()
+    ctx = ProxyRunnerContext('127.0.0.1', port, 'mysession', 'myapp')
+    ctx.api_session = DummyAPISession(events)
+    ctx.local_server = await asyncio.start_server(
+        ctx.accept_connection, '127.0.0.1', port)
+    try:
+        yield ctx, events
+    finally:
+        if ctx.local_server is not None:
+            ctx.local_server.close()
+
+
+@pytest.mark.asyncio
+async def test_proxy_ctx_terminates_running_connections(proxy_ctx_fixture):
+    ctx, events = proxy_ctx_fixture
+    reader, writer = await asyncio.open_connection('127.0.0.1', ctx.port)
+    for _ in range(100):
+        if events:
+            break
+        await asyncio.sleep(0.01)
+    assert len(ctx.connection_tasks) == 1
+    await ctx.__aexit__(None, None, None)
+    assert events == ['connection-started', 'connection-cancelled', 'api-session-closed']
+    assert not ctx.connection_tasks
+    assert await reader.read() == b''
+    writer.close()
+
+
+@pytest.mark.asyncio
+async def test_proxy_ctx_terminates_not_started_connections(proxy_ctx_fixture):
+    ctx, events = proxy_ctx_fixture
+    reader = asyncio.StreamReader()
+    writer = mock.Mock()
+    ctx.accept_connection(reader, writer)
+    (task,) = ctx.connection_tasks
+    await ctx.__aexit__(None, None, None)
+    assert task.cancelled()
+    assert events == ['api-session-closed']
+    assert not ctx.connection_tasks
+    writer.close.assert_called_once_with()
+
+
+@pytest.fixture
+async def ws_server_fixture(unused_tcp_port_factory):
+    """
+    Runs a WebSocket server which replays the given coroutine function
+    for each connection.
+    """
+    port = unused_tcp_port_factory()
+    scenario = None
+
+    async def ws_handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await scenario(ws)
+        await ws.close()
+        return ws
+
+    def set_scenario(func):
+        nonlocal scenario
+        scenario = func
+
+    app = web.Application()
+    app.router.add_route('GET', '/ws', ws_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    try:
+        yield f'http://127.0.0.1:{port}/ws', set_scenario
+    finally:
+        await runner.cleanup()
+
+
+async def relay_downstream_with_timestamps(url):
+    """
+    Connects to the given URL, waits until the server sends all messages,
+    and relays them via WSProxy.relay_downstream() to a mocked local client.
+    Returns the list of written data with the elapsed time.
+    """
+    loop = asyncio.get_running_loop()
+    writes = []
+    writer = mock.Mock()
+    writer.write.side_effect = lambda data: writes.append((loop.time() - begin, data))
+    writer.drain = mock.AsyncMock()
+    writer.wait_closed = mock.AsyncMock()
+    p = WSProxy(mock.Mock(), 'mysession', 'myapp', {}, {},
+                asyncio.StreamReader(), writer)
+    async with aiohttp.ClientSession() as client_session:
+        async with client_session.ws_connect(url) as raw_ws:
+            # Let the already-sent messages be queued in the client.
+            await asyncio.sleep(0.2)
+            begin = loop.time()
+            await p.relay_downstream(WebSocketResponse(mock.Mock(), raw_ws))
+    writer.close.assert_called_once_with()
+    return writes
+
+
+@pytest.mark.asyncio
+async def test_relay_downstream_merges_queued_messages(ws_server_fixture):
+    url, set_scenario = ws_server_fixture
+
+    async def scenario(ws):
+        await ws.send_bytes(b'hello')
+        await ws.send_bytes(b'world')
+        await ws.send_bytes(b'!')
+        await asyncio.sleep(0.5)
+
+    set_scenario(scenario)
+    writes = await relay_downstream_with_timestamps(url)
+    assert [data for _, data in writes] == [b'helloworld!']
+    assert writes[0][0] < 0.1
+
+
+@pytest.mark.asyncio
+async def test_relay_downstream_does_not_hold_data_behind_control_frames(ws_server_fixture):
+    url, set_scenario = ws_server_fixture
+
+    async def scenario(ws):
+        await ws.send_bytes(b'hello')
+        await ws.ping()
+        await asyncio.sleep(0.5)
+        await ws.send_bytes(b'world')
+
+    set_scenario(scenario)
+    writes = await relay_downstream_with_timestamps(url)
+    assert [data for _, data in writes] == [b'hello', b'world']
+    assert writes[0][0] < 0.1
+    assert writes[1][0] >= 0.2
+
+
+def test_is_binary_queued():
+    raw_ws = mock.Mock()
+    binary_msg = aiohttp.WSMessage(aiohttp.WSMsgType.BINARY, b'data', None)
+    pong_msg = aiohttp.WSMessage(aiohttp.WSMsgType.PONG, b'', None)
+    raw_ws._reader._buffer = collections.deque()
+    assert not _is_binary_queued(raw_ws)
+    raw_ws._reader._buffer.append((binary_msg, 4))
+    assert _is_binary_queued(raw_ws)
+    raw_ws._reader._buffer.appendleft((pong_msg, 0))
+    assert not _is_binary_queued(raw_ws)
+    # Unsupported internals of other aiohttp versions turn off merging.
+    raw_ws._reader = object()
+    assert not _is_binary_queued(raw_ws)
+    raw_ws._reader = mock.Mock(_buffer=collections.deque([binary_msg]))
+    assert not _is_binary_queued(raw_ws)
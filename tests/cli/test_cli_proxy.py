@@ -1,9 +1,14 @@
+import contextlib
+import os
+from unittest import mock
+
 import aiohttp
 from aiohttp import web
 import pytest
 
-from ai.backend.client import config
-from ai.backend.client.cli.proxy import create_proxy_app
+from ai.backend.client import config, request
+from ai.backend.client.config import MIN_PROXY_BUFFER_SIZE, PROXY_DRAIN_HIGH_WATER
+from ai.backend.client.cli.proxy import WebSocketProxy, create_proxy_app
 
 
 @pytest.fixture
@@ -11,6 +16,8 @@ async def api_app_fixture(unused_tcp_port_factory):
     api_port = unused_tcp_port_factory()
     app = web.Application()
     recv_queue = []
+    # Larger than the drain threshold and not aligned to the buffer sizes.
+    download_body = os.urandom(4 * PROXY_DRAIN_HIGH_WATER + 12345)
 
     async def echo_ws(request):
         ws = web.WebSocketResponse()
@@ -32,7 +39,23 @@ async def api_app_fixture(unused_tcp_port_factory):
         resp.headers['Content-Type'] = request.content_type
         return resp
 
+    async def download(request):
+        resp = web.StreamResponse()
+        resp.content_type = 'application/octet-stream'
+        await resp.prepare(request)
+        # Write in uneven pieces to let the proxy see various chunk boundaries.
+        offset = 0
+        piece_size = 1000
+        while offset < len(download_body):
+            await resp.write(download_body[offset:offset + piece_size])
+            offset += piece_size
+            piece_size = piece_size * 3 % 100003
+        await resp.write_eof()
+        return resp
+
+    app['download_body'] = download_body
     app.router.add_route('GET', r'/stream/echo', echo_ws)
+    app.router.add_route('GET', r'/download', download)
     app.router.add_route('POST', r'/echo', echo_web)
     runner = web.AppRunner(app)
     await runner.setup()
@@ -58,6 +81,35 @@ async def proxy_app_fixture(unused_tcp_port_factory):
         await runner.cleanup()
 
 
+@pytest.fixture
+def local_api_fixture(monkeypatch, example_keypair, api_app_fixture):
+    api_app, recv_queue, api_port = api_app_fixture
+    config.set_config(config.APIConfig(
+        endpoint='http://127.0.0.1:{}'.format(api_port),
+        access_key=example_keypair[0],
+        secret_key=example_keypair[1],
+    ))
+    # The test API server does not check signatures.
+    noop_sign = lambda *args, **kwargs: ({}, None)
+    monkeypatch.setattr(request, 'generate_signature', noop_sign)
+    return api_app, recv_queue, api_port
+
+
+@contextlib.asynccontextmanager
+async def run_proxy_app(port, **kwargs):
+    # Set up and clean up the proxy app in the same task, as its client session
+    # resets a context variable set in the setup phase when cleaned up.
+    app = create_proxy_app(**kwargs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(port)
+    finally:
+        await runner.cleanup()
+
+
 @pytest.mark.xfail(
     reason="pytest-dev/pytest-asyncio#153 should be resolved to make this test working"
 )
@@ -142,3 +194,56 @@ async def test_proxy_websocket(
         assert recv_queue[1].type == aiohttp.WSMsgType.BINARY
         assert recv_queue[1].data == b'\x00\x00'
         await ws.close()
+
+
+@pytest.mark.asyncio
+async def test_proxy_websocket_relays_messages(local_api_fixture, unused_tcp_port_factory):
+    api_app, recv_queue, api_port = local_api_fixture
+    async with run_proxy_app(unused_tcp_port_factory()) as proxy_url:
+        async with aiohttp.ClientSession() as proxy_client:
+            async with proxy_client.ws_connect(proxy_url + '/stream/echo') as ws:
+                await ws.send_str('test')
+                assert await ws.receive_str() == 'test'
+                await ws.send_bytes(b'\x00\x00')
+                assert await ws.receive_bytes() == b'\x00\x00'
+                await ws.send_str('again')
+                assert await ws.receive_str() == 'again'
+    assert [(msg.type, msg.data) for msg in recv_queue] == [
+        (aiohttp.WSMsgType.TEXT, 'test'),
+        (aiohttp.WSMsgType.BINARY, b'\x00\x00'),
+        (aiohttp.WSMsgType.TEXT, 'again'),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_websocket_proxy_send_skips_closed_upstream():
+    up_conn = mock.Mock()
+    up_conn.closed = True
+    up_conn.send_str = mock.AsyncMock()
+    up_conn.send_bytes = mock.AsyncMock()
+    p = WebSocketProxy(up_conn, mock.Mock())
+    await p.send('test', aiohttp.WSMsgType.TEXT)
+    await p.send(b'test', aiohttp.WSMsgType.BINARY)
+    up_conn.send_str.assert_not_called()
+    up_conn.send_bytes.assert_not_called()
+    up_conn.closed = False
+    await p.send('test', aiohttp.WSMsgType.TEXT)
+    await p.send(b'test', aiohttp.WSMsgType.BINARY)
+    up_conn.send_str.assert_awaited_once_with('test')
+    up_conn.send_bytes.assert_awaited_once_with(b'test')
+
+
+@pytest.mark.parametrize('buffer_size', [MIN_PROXY_BUFFER_SIZE, None])
+@pytest.mark.asyncio
+async def test_proxy_web_streams_large_body(
+    local_api_fixture, unused_tcp_port_factory, buffer_size,
+):
+    api_app, recv_queue, api_port = local_api_fixture
+    kwargs = {} if buffer_size is None else {'buffer_size': buffer_size}
+    async with run_proxy_app(unused_tcp_port_factory(), **kwargs) as proxy_url:
+        async with aiohttp.ClientSession() as proxy_client:
+            async with proxy_client.get(proxy_url + '/download') as resp:
+                assert resp.status == 200
+                body = await resp.read()
+    assert len(body) == len(api_app['download_body'])
+    assert body == api_app['download_body']
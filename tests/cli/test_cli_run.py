@@ -0,0 +1,65 @@
+import contextlib
+import io
+import json
+from unittest import mock
+
+import aiohttp
+import pytest
+
+from ai.backend.client.cli.run import exec_loop
+
+
+def create_stream_session(results):
+    """
+    Creates a mocked compute session whose stream_execute() yields
+    the given results as WebSocket text messages.
+    """
+
+    async def stream():
+        for result in results:
+            yield aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, json.dumps(result), None)
+
+    @contextlib.asynccontextmanager
+    async def stream_execute(code, *, mode, opts):
+        yield stream()
+
+    compute_session = mock.Mock()
+    compute_session.stream_execute = stream_execute
+    return compute_session
+
+
+@pytest.mark.asyncio
+async def test_exec_loop_console_output():
+    compute_session = create_stream_session([
+        {
+            'status': 'continued',
+            'console': [
+                ['stdout', 'hello '],
+                ['stderr', 'oops\n'],
+                ['stdout', 'world\n'],
+                ['html', '<b>bold</b>'],
+            ],
+        },
+        {
+            'status': 'finished',
+            'exitCode': 0,
+            'console': [
+                ['stdout', 'bye'],
+                ['stderr', 'done'],
+            ],
+        },
+    ])
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    vprint_done = mock.Mock()
+    await exec_loop(stdout, stderr, compute_session, 'query', 'print(1)',
+                    vprint_done=vprint_done)
+    assert stdout.getvalue() == (
+        'hello world\n'
+        '----- output record (type: html) -----\n'
+        '<b>bold</b>\n'
+        '----- end of record -----\n'
+        'bye'
+    )
+    assert stderr.getvalue() == 'oops\ndone'
+    vprint_done.assert_called_once_with('Execution finished. (exit code = 0)')
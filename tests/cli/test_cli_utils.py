@@ -0,0 +1,34 @@
+import click
+import pytest
+
+from ai.backend.client.cli.utils import ByteSizeParamType
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('4096', 4096),
+    ('64k', 64 * (2**10)),
+    ('1.5M', 3 * (2**19)),
+    (65536, 65536),
+])
+def test_byte_size_param_type(value, expected):
+    param_type = ByteSizeParamType()
+    assert param_type.convert(value, None, None) == expected
+
+
+def test_byte_size_param_type_invalid():
+    param_type = ByteSizeParamType()
+    with pytest.raises(click.BadParameter):
+        param_type.convert('12x', None, None)
+
+
+@pytest.mark.parametrize('value', ['4k', '4096', '1m', 4096])
+def test_byte_size_param_type_min_value_accepted(value):
+    param_type = ByteSizeParamType(min_value=4096)
+    assert param_type.convert(value, None, None) >= 4096
+
+
+@pytest.mark.parametrize('value', ['4095', '1k', '0', 100])
+def test_byte_size_param_type_min_value_rejected(value):
+    param_type = ByteSizeParamType(min_value=4096)
+    with pytest.raises(click.BadParameter, match='smaller than the minimum'):
+        param_type.convert(value, None, None)